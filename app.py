@@ -1,32 +1,183 @@
 import os
-import xml.etree.ElementTree as ET
+from lxml import etree as ET
+import re
 import math
 import logging
-from datetime import datetime, timedelta
+import threading
+import numpy as np
+from operator import itemgetter
 from typing import Dict, List, Any, Optional
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Namespaces dos formatos suportados
+NAMESPACE_ISO = 'urn:iso:std:iso:20022:tech:xsd:semt.003.001.04'
+NAMESPACE_HEADER = 'urn:iso:std:iso:20022:tech:xsd:head.001.001.01'
+NAMESPACE_ANBIMA = 'http://www.anbima.com.br/SchemaPosicaoAtivos'
+
+_ISO_NS = {'ISO': NAMESPACE_ISO}
+
+
+def _xpath(expression: str) -> ET.XPath:
+    """Compila uma expressão XPath com o namespace ISO (uma vez, no load do módulo)"""
+    return ET.XPath(expression, namespaces=_ISO_NS)
+
+
+# XPaths compilados uma única vez - avaliação roda em C (libxml2)
+_XP_SUB_ACCOUNTS = _xpath('.//ISO:BalForSubAcct')
+_XP_TYPE_CD = _xpath('./ISO:Tp/ISO:Cd/text()')
+
+# Tags qualificadas pré-computadas para o dispatch dos passes únicos
+# em extract_iso_fund_info e extract_iso_positions
+_ISO_TAG = '{%s}' % NAMESPACE_ISO
+_TAG_DESC = _ISO_TAG + 'Desc'
+_TAG_ISIN = _ISO_TAG + 'ISIN'
+_TAG_ID = _ISO_TAG + 'Id'
+_TAG_DT = _ISO_TAG + 'Dt'
+_TAG_AMT = _ISO_TAG + 'Amt'
+_TAG_UNIT = _ISO_TAG + 'Unit'
+_TAG_FIN_INSTRM_ID = _ISO_TAG + 'FinInstrmId'
+_TAG_OTHR_ID = _ISO_TAG + 'OthrId'
+_TAG_STMT_DT_TM = _ISO_TAG + 'StmtDtTm'
+_TAG_QTY = _ISO_TAG + 'Qty'
+_TAG_AGGT_BAL = _ISO_TAG + 'AggtBal'
+_TAG_TTL_HLDGS = _ISO_TAG + 'TtlHldgsValOfStmt'
+_TAG_HLDG_VAL = _ISO_TAG + 'HldgVal'
+_TAG_VAL = _ISO_TAG + 'Val'
+_TAG_PRIC_DTLS = _ISO_TAG + 'PricDtls'
+_TAG_ACCT_BASE_CCY_AMTS = _ISO_TAG + 'AcctBaseCcyAmts'
+_TAG_ALTRN_CLSSFCTN = _ISO_TAG + 'AltrnClssfctn'
+
+
+# Constantes de fallback montadas uma única vez no load do módulo;
+# os métodos devolvem cópias rasas para os chamadores
+_DEFAULT_STRESS_SCENARIOS = {
+    'ibovespa_worst': 'Cenário IBOVESPA: Queda de 15%',
+    'juros_pre_worst': 'Cenário Juros: Alta de 200bps',
+    'cupom_cambial_worst': 'Cenário Cupom Cambial: Alta de 150bps',
+    'dolar_worst': 'Cenário Dólar: Valorização de 20%',
+    'outros_worst': 'Cenário Outros: Stress de Liquidez'
+}
+
+# Classificação de risco por palavras-chave no nome do instrumento: um
+# único scan do regex compilado substitui as cadeias de 'term in name'.
+# A ordem de prioridade (juros > imobiliário > crédito > câmbio) replica
+# o elif ladder original
+_RISK_TERMS_RE = re.compile(
+    r'(?P<juros_pre>SELIC|CDI|TESOURO)'
+    r'|(?P<imobiliario>FII|IMOBILIARIO)'
+    r'|(?P<credito>FIDC|CREDITO)'
+    r'|(?P<cambio>DOLAR|CAMBIAL)'
+)
+
+_RISK_PRIORITY = ('juros_pre', 'imobiliario', 'credito', 'cambio')
+
+_RISK_CLASSIFICATIONS = {
+    'juros_pre': {
+        'risk_type': 'JUROS_PRE',
+        'risk_factor': 'Taxa de Juros Pré-fixado',
+        'risk_level': 'BAIXO'
+    },
+    'imobiliario': {
+        'risk_type': 'OUTROS',
+        'risk_factor': 'Risco Imobiliário',
+        'risk_level': 'MEDIO'
+    },
+    'credito': {
+        'risk_type': 'OUTROS',
+        'risk_factor': 'Risco de Crédito',
+        'risk_level': 'MEDIO'
+    },
+    'cambio': {
+        'risk_type': 'DOLAR',
+        'risk_factor': 'Taxa de Câmbio',
+        'risk_level': 'ALTO'
+    }
+}
+
+# Parâmetros do modelo de VaR: 95% de confiança, horizonte de 21 dias úteis
+_Z_SCORE_95 = 1.645
+_SQRT_21 = math.sqrt(21)
+
+
+def _statement_date_key(result: Dict[str, Any]) -> str:
+    """Chave de ordenação cronológica de um resultado de parse"""
+    return result.get('fund_info', {}).get('statement_date', '')
+
+_DEFAULT_METRICS = {
+    'var_21_days_95_percent': 7.5,
+    'var_model_class': "Modelo Paramétrico Padrão",
+    'daily_volatility': 1.5,
+    'mean_return': 0.05,
+    'worst_return': -2.5,
+    'observations': 0,
+    'stress_scenarios': _DEFAULT_STRESS_SCENARIOS
+}
+
+
+def positions_to_arrays(positions: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Converte a lista de posições (dicts) em colunas NumPy (SoA).
+
+    Os dicts continuam sendo o formato de saída/JSON; as rotinas de
+    análise recebem colunas float64 vetorizáveis no lugar de iterar
+    dict por dict.
+    """
+    n = len(positions)
+    return {
+        'instrument_name': np.array([p.get('instrument_name', '') for p in positions],
+                                    dtype=object),
+        'isin': np.array([p.get('isin', '') for p in positions], dtype=object),
+        'quantity': np.fromiter((p.get('quantity', 0.0) for p in positions),
+                                dtype=np.float64, count=n),
+        'unit_price': np.fromiter((p.get('unit_price', 0.0) for p in positions),
+                                  dtype=np.float64, count=n),
+        'holding_value': np.fromiter((p.get('holding_value', 0.0) for p in positions),
+                                     dtype=np.float64, count=n),
+    }
+
+
+_parser_local = threading.local()
+
+
+def _get_parser() -> ET.XMLParser:
+    """Parser lxml reutilizável, um por thread (parsers não são thread-safe).
+
+    collect_ids/remove_blank_text desligam indexação de xml:id e nós de
+    whitespace que ninguém usa; resolve_entities/no_network desligados
+    também por segurança (XXE).
+    """
+    parser = getattr(_parser_local, 'parser', None)
+    if parser is None:
+        parser = ET.XMLParser(collect_ids=False, remove_blank_text=True,
+                              resolve_entities=False, no_network=True)
+        _parser_local.parser = parser
+    return parser
+
+
 class UnifiedXMLRiskAnalyzer:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.namespaces_iso = {
-            'HEADER': 'urn:iso:std:iso:20022:tech:xsd:head.001.001.01',
-            'ISO': 'urn:iso:std:iso:20022:tech:xsd:semt.003.001.04',
-            'default': 'http://www.anbima.com.br/SchemaPosicaoAtivos'
-        }
+        # Cache de parsing por arquivo: path -> ((mtime_ns, size), resultado)
+        # Evita re-parsear XMLs inalterados em chamadas repetidas
+        self._parse_cache: Dict[str, tuple] = {}
+        self._cache_lock = threading.Lock()
     
     def detect_xml_format(self, file_path: str) -> str:
         """Detecta automaticamente o formato do XML"""
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            if root.tag == 'arquivoposicao_4_01':
+            # Streaming com early-exit: só o evento de abertura da raiz é
+            # necessário, sem montar o DOM do arquivo inteiro
+            root_tag = None
+            for _, elem in ET.iterparse(file_path, events=('start',)):
+                root_tag = elem.tag
+                break
+
+            if root_tag == 'arquivoposicao_4_01':
                 return 'ANBIMA_SIMPLE'
-            elif 'PosicaoAtivosCarteira' in root.tag:
+            elif root_tag is not None and 'PosicaoAtivosCarteira' in root_tag:
                 return 'ISO20022_ANBIMA'
             else:
                 return 'UNKNOWN'
@@ -36,20 +187,38 @@ class UnifiedXMLRiskAnalyzer:
     
     def parse_xml_file(self, file_path: str) -> Dict[str, Any]:
         """Parser principal que detecta formato e chama o parser apropriado"""
+        try:
+            st = os.stat(file_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+
+        if stamp is not None:
+            with self._cache_lock:
+                cached = self._parse_cache.get(file_path)
+                if cached is not None and cached[0] == stamp:
+                    return cached[1]
+
         format_type = self.detect_xml_format(file_path)
         self.logger.info(f"Formato detectado: {format_type} para {os.path.basename(file_path)}")
-        
+
         if format_type == 'ANBIMA_SIMPLE':
-            return self.parse_anbima_simple(file_path)
+            result = self.parse_anbima_simple(file_path)
         elif format_type == 'ISO20022_ANBIMA':
-            return self.parse_iso20022_anbima(file_path)
+            result = self.parse_iso20022_anbima(file_path)
         else:
-            return {'error': f'Formato não suportado: {format_type}'}
+            result = {'error': f'Formato não suportado: {format_type}'}
+
+        if stamp is not None:
+            with self._cache_lock:
+                self._parse_cache[file_path] = (stamp, result)
+
+        return result
     
     def parse_anbima_simple(self, file_path: str) -> Dict[str, Any]:
         """Parser para formato ANBIMA simples (arquivoposicao_4_01)"""
         try:
-            tree = ET.parse(file_path)
+            tree = ET.parse(file_path, parser=_get_parser())
             root = tree.getroot()
             
             # Extrair header do fundo
@@ -89,7 +258,7 @@ class UnifiedXMLRiskAnalyzer:
     def parse_iso20022_anbima(self, file_path: str) -> Dict[str, Any]:
         """Parser para formato ISO 20022 com namespace ANBIMA"""
         try:
-            tree = ET.parse(file_path)
+            tree = ET.parse(file_path, parser=_get_parser())
             root = tree.getroot()
             
             # Extrair informações do fundo principal
@@ -195,46 +364,66 @@ class UnifiedXMLRiskAnalyzer:
     def extract_iso_fund_info(self, root) -> Dict[str, Any]:
         """Extrai informações do fundo no formato ISO20022"""
         fund_info = {}
-        
+
         try:
-            # Nome do fundo
-            desc_elem = root.find('.//ISO:FinInstrmId/ISO:Desc', self.namespaces_iso)
-            if desc_elem is not None:
-                fund_info['fund_name'] = desc_elem.text
-            
-            # CNPJ do fundo
-            cnpj_elem = root.find('.//ISO:FinInstrmId/ISO:OthrId/ISO:Id', self.namespaces_iso)
-            if cnpj_elem is not None:
-                fund_info['fund_cnpj'] = cnpj_elem.text
-            
-            # Data da posição
-            date_elem = root.find('.//ISO:StmtDtTm/ISO:Dt', self.namespaces_iso)
-            if date_elem is not None:
-                fund_info['statement_date'] = date_elem.text
-            
-            # NAV
-            nav_elem = root.find('.//ISO:PricDtls[ISO:Tp/ISO:Cd="NAVL"]/ISO:Val/ISO:Amt', self.namespaces_iso)
-            if nav_elem is not None:
-                fund_info['nav_price'] = float(nav_elem.text)
-            
-            # Quantidade total de cotas
-            qty_elem = root.find('.//ISO:AggtBal/ISO:Qty/ISO:Qty/ISO:Qty/ISO:Unit', self.namespaces_iso)
-            if qty_elem is not None:
-                fund_info['total_units'] = float(qty_elem.text)
-            
-            # Valor total da carteira
-            total_elem = root.find('.//ISO:TtlHldgsValOfStmt/ISO:Amt', self.namespaces_iso)
-            if total_elem is not None:
-                fund_info['total_holdings'] = float(total_elem.text)
-            
-            # Patrimônio líquido (valor principal)
-            pl_elem = root.find('.//ISO:HldgVal/ISO:Amt', self.namespaces_iso)
-            if pl_elem is not None:
-                fund_info['net_assets'] = float(pl_elem.text)
-                
+            # Um único passe pela árvore no lugar de um descent recursivo por
+            # campo; o primeiro match em ordem de documento vence, igual aos
+            # XPaths './/' que este passe substitui
+            for elem in root.iter(_TAG_DESC, _TAG_ID, _TAG_DT, _TAG_UNIT, _TAG_AMT):
+                tag = elem.tag
+                parent = elem.getparent()
+                if parent is None:
+                    continue
+
+                if tag == _TAG_DESC:
+                    # Nome do fundo
+                    if 'fund_name' not in fund_info and parent.tag == _TAG_FIN_INSTRM_ID:
+                        fund_info['fund_name'] = elem.text
+
+                elif tag == _TAG_ID:
+                    # CNPJ do fundo
+                    if ('fund_cnpj' not in fund_info and parent.tag == _TAG_OTHR_ID
+                            and parent.getparent() is not None
+                            and parent.getparent().tag == _TAG_FIN_INSTRM_ID):
+                        fund_info['fund_cnpj'] = elem.text
+
+                elif tag == _TAG_DT:
+                    # Data da posição
+                    if 'statement_date' not in fund_info and parent.tag == _TAG_STMT_DT_TM:
+                        fund_info['statement_date'] = elem.text
+
+                elif tag == _TAG_UNIT:
+                    # Quantidade total de cotas (AggtBal/Qty/Qty/Qty/Unit)
+                    if 'total_units' not in fund_info and parent.tag == _TAG_QTY:
+                        gp = parent.getparent()
+                        ggp = gp.getparent() if gp is not None else None
+                        if (gp is not None and gp.tag == _TAG_QTY
+                                and ggp is not None and ggp.tag == _TAG_QTY
+                                and ggp.getparent() is not None
+                                and ggp.getparent().tag == _TAG_AGGT_BAL):
+                            fund_info['total_units'] = float(elem.text)
+
+                else:  # _TAG_AMT
+                    ptag = parent.tag
+                    if ptag == _TAG_TTL_HLDGS:
+                        # Valor total da carteira
+                        fund_info.setdefault('total_holdings', float(elem.text))
+                    elif ptag == _TAG_HLDG_VAL:
+                        # Patrimônio líquido (valor principal)
+                        fund_info.setdefault('net_assets', float(elem.text))
+                    elif ptag == _TAG_VAL and 'nav_price' not in fund_info:
+                        # NAV (PricDtls com Tp/Cd = NAVL)
+                        pric_dtls = parent.getparent()
+                        if (pric_dtls is not None and pric_dtls.tag == _TAG_PRIC_DTLS
+                                and 'NAVL' in _XP_TYPE_CD(pric_dtls)):
+                            fund_info['nav_price'] = float(elem.text)
+
+                if len(fund_info) == 7:
+                    break
+
         except Exception as e:
             self.logger.warning(f"Erro na extração ISO fund_info: {e}")
-        
+
         return fund_info
     
     def extract_iso_positions(self, root) -> List[Dict[str, Any]]:
@@ -242,44 +431,67 @@ class UnifiedXMLRiskAnalyzer:
         positions = []
         
         try:
-            for sub_account in root.findall('.//ISO:BalForSubAcct', self.namespaces_iso):
+            for sub_account in _XP_SUB_ACCOUNTS(root):
                 position = {}
-                
-                # Nome do instrumento
-                desc_elem = sub_account.find('.//ISO:FinInstrmId/ISO:Desc', self.namespaces_iso)
-                if desc_elem is not None:
-                    position['instrument_name'] = desc_elem.text
-                
-                # ISIN
-                isin_elem = sub_account.find('.//ISO:FinInstrmId/ISO:ISIN', self.namespaces_iso)
-                if isin_elem is not None:
-                    position['isin'] = isin_elem.text
-                
-                # CNPJ do fundo investido
-                cnpj_elem = sub_account.find('.//ISO:FinInstrmId/ISO:OthrId[ISO:Tp/ISO:Cd="CNPJ"]/ISO:Id', self.namespaces_iso)
-                if cnpj_elem is not None:
-                    position['fund_cnpj'] = cnpj_elem.text
-                
-                # Quantidade
-                qty_elem = sub_account.find('.//ISO:AggtBal/ISO:Qty/ISO:Qty/ISO:Qty/ISO:Unit', self.namespaces_iso)
-                if qty_elem is not None:
-                    position['quantity'] = float(qty_elem.text)
-                
-                # Preço unitário
-                price_elem = sub_account.find('.//ISO:PricDtls/ISO:Val/ISO:Amt', self.namespaces_iso)
-                if price_elem is not None:
-                    position['unit_price'] = float(price_elem.text)
-                
-                # Valor da posição
-                value_elem = sub_account.find('.//ISO:AcctBaseCcyAmts/ISO:HldgVal/ISO:Amt', self.namespaces_iso)
-                if value_elem is not None:
-                    position['holding_value'] = float(value_elem.text)
-                
-                # Classificação CVM
-                class_elem = sub_account.find('.//ISO:ClssfctnTp/ISO:AltrnClssfctn/ISO:Id', self.namespaces_iso)
-                if class_elem is not None:
-                    position['cvm_classification'] = class_elem.text
-                
+
+                # Passe único pelo sub-account com dispatch por tag/pai,
+                # espelhando extract_iso_fund_info: um O(N) no lugar de
+                # sete descents recursivos por posição
+                for elem in sub_account.iter(_TAG_DESC, _TAG_ISIN, _TAG_ID,
+                                             _TAG_UNIT, _TAG_AMT):
+                    tag = elem.tag
+                    parent = elem.getparent()
+                    if parent is None:
+                        continue
+
+                    if tag == _TAG_DESC:
+                        # Nome do instrumento
+                        if 'instrument_name' not in position and parent.tag == _TAG_FIN_INSTRM_ID:
+                            position['instrument_name'] = elem.text
+
+                    elif tag == _TAG_ISIN:
+                        if 'isin' not in position and parent.tag == _TAG_FIN_INSTRM_ID:
+                            position['isin'] = elem.text
+
+                    elif tag == _TAG_ID:
+                        ptag = parent.tag
+                        if (ptag == _TAG_OTHR_ID and 'fund_cnpj' not in position
+                                and parent.getparent() is not None
+                                and parent.getparent().tag == _TAG_FIN_INSTRM_ID
+                                and 'CNPJ' in _XP_TYPE_CD(parent)):
+                            # CNPJ do fundo investido
+                            position['fund_cnpj'] = elem.text
+                        elif ptag == _TAG_ALTRN_CLSSFCTN and 'cvm_classification' not in position:
+                            # Classificação CVM
+                            position['cvm_classification'] = elem.text
+
+                    elif tag == _TAG_UNIT:
+                        # Quantidade (AggtBal/Qty/Qty/Qty/Unit)
+                        if 'quantity' not in position and parent.tag == _TAG_QTY:
+                            gp = parent.getparent()
+                            ggp = gp.getparent() if gp is not None else None
+                            if (gp is not None and gp.tag == _TAG_QTY
+                                    and ggp is not None and ggp.tag == _TAG_QTY
+                                    and ggp.getparent() is not None
+                                    and ggp.getparent().tag == _TAG_AGGT_BAL):
+                                position['quantity'] = float(elem.text)
+
+                    else:  # _TAG_AMT
+                        ptag = parent.tag
+                        if (ptag == _TAG_VAL and 'unit_price' not in position
+                                and parent.getparent() is not None
+                                and parent.getparent().tag == _TAG_PRIC_DTLS):
+                            # Preço unitário
+                            position['unit_price'] = float(elem.text)
+                        elif (ptag == _TAG_HLDG_VAL and 'holding_value' not in position
+                                and parent.getparent() is not None
+                                and parent.getparent().tag == _TAG_ACCT_BASE_CCY_AMTS):
+                            # Valor da posição
+                            position['holding_value'] = float(elem.text)
+
+                    if len(position) == 7:
+                        break
+
                 if position:  # Só adiciona se tem dados
                     positions.append(position)
                     
@@ -299,31 +511,14 @@ class UnifiedXMLRiskAnalyzer:
             'risk_level': 'MEDIO'
         }
         
-        # Classificação por nome do instrumento
-        if any(term in instrument_name for term in ['SELIC', 'CDI', 'TESOURO']):
-            risk_classification.update({
-                'risk_type': 'JUROS_PRE',
-                'risk_factor': 'Taxa de Juros Pré-fixado',
-                'risk_level': 'BAIXO'
-            })
-        elif any(term in instrument_name for term in ['FII', 'IMOBILIARIO']):
-            risk_classification.update({
-                'risk_type': 'OUTROS',
-                'risk_factor': 'Risco Imobiliário',
-                'risk_level': 'MEDIO'
-            })
-        elif any(term in instrument_name for term in ['FIDC', 'CREDITO']):
-            risk_classification.update({
-                'risk_type': 'OUTROS',
-                'risk_factor': 'Risco de Crédito',
-                'risk_level': 'MEDIO'
-            })
-        elif any(term in instrument_name for term in ['DOLAR', 'CAMBIAL']):
-            risk_classification.update({
-                'risk_type': 'DOLAR',
-                'risk_factor': 'Taxa de Câmbio',
-                'risk_level': 'ALTO'
-            })
+        # Classificação por nome do instrumento: coleta os grupos que
+        # casaram num passe só e aplica a prioridade do ladder original
+        matched = {m.lastgroup for m in _RISK_TERMS_RE.finditer(instrument_name)}
+        if matched:
+            for group in _RISK_PRIORITY:
+                if group in matched:
+                    risk_classification.update(_RISK_CLASSIFICATIONS[group])
+                    break
         
         # Classificação CVM 37 = FII
         if cvm_class == '37':
@@ -335,11 +530,17 @@ class UnifiedXMLRiskAnalyzer:
         
         return risk_classification
     
-    def calculate_var_and_metrics(self, all_results: List[Dict]) -> Dict[str, Any]:
-        """Calcula VaR e métricas de risco baseadas nos dados reais"""
+    def calculate_var_and_metrics(self, valid_results: List[Dict],
+                                  latest_result: Optional[Dict] = None) -> Dict[str, Any]:
+        """Calcula VaR e métricas de risco baseadas nos dados reais.
+
+        Recebe apenas resultados válidos (já filtrados pelo chamador) e,
+        opcionalmente, o resultado mais recente já localizado — evita
+        varrer a lista de novo em cada helper.
+        """
         try:
-            valid_results = [r for r in all_results if r.get('success', False)]
-            
+            if latest_result is None and valid_results:
+                latest_result = max(valid_results, key=_statement_date_key)
             if len(valid_results) < 2:
                 return self.get_default_metrics()
             
@@ -361,32 +562,28 @@ class UnifiedXMLRiskAnalyzer:
                     })
             
             # Ordenar por data
-            nav_series.sort(key=lambda x: x['date'])
-            
-            # Calcular retornos diários
-            returns = []
-            for i in range(1, len(nav_series)):
-                prev_nav = nav_series[i-1]['nav']
-                curr_nav = nav_series[i]['nav']
-                if prev_nav > 0:
-                    return_pct = (curr_nav - prev_nav) / prev_nav
-                    returns.append(return_pct)
-            
-            if len(returns) < 2:
-                return self.calculate_from_portfolio_analysis(valid_results)
+            nav_series.sort(key=itemgetter('date'))
             
+            # Calcular retornos diários em uma única passada vetorizada
+            navs = np.fromiter((p['nav'] for p in nav_series), dtype=np.float64,
+                               count=len(nav_series))
+            prev = navs[:-1]
+            returns = (navs[1:] - prev)[prev > 0] / prev[prev > 0]
+
+            if returns.size < 2:
+                return self.calculate_from_portfolio_analysis(valid_results, latest_result)
+
             # Estatísticas dos retornos
-            mean_return = sum(returns) / len(returns)
-            variance = sum((r - mean_return) ** 2 for r in returns) / (len(returns) - 1) if len(returns) > 1 else 0
+            mean_return = float(returns.mean())
+            variance = float(returns.var(ddof=1))
             volatility = math.sqrt(variance) if variance > 0 else 0.015
             
             # VaR 95% para 21 dias úteis
-            z_score_95 = 1.645  # 95% de confiança
-            var_1d = z_score_95 * volatility
-            var_21d = var_1d * math.sqrt(21)
+            var_1d = _Z_SCORE_95 * volatility
+            var_21d = var_1d * _SQRT_21
             
             # Análise da carteira para sensibilidades
-            portfolio_analysis = self.analyze_portfolio_composition(valid_results[-1])  # Mais recente
+            portfolio_analysis = self.analyze_portfolio_composition(latest_result)  # Mais recente
             
             # Cenários de stress
             stress_scenarios = self.calculate_stress_scenarios(portfolio_analysis)
@@ -396,7 +593,7 @@ class UnifiedXMLRiskAnalyzer:
                 'var_model_class': f"Simulação Histórica ({len(returns)} observações)",
                 'daily_volatility': volatility * 100,
                 'mean_return': mean_return * 100,
-                'worst_return': min(returns) * 100 if returns else -2.0,
+                'worst_return': float(returns.min()) * 100 if returns.size else -2.0,
                 'observations': len(returns),
                 'portfolio_analysis': portfolio_analysis,
                 'stress_scenarios': stress_scenarios
@@ -409,8 +606,7 @@ class UnifiedXMLRiskAnalyzer:
     def analyze_portfolio_composition(self, latest_result: Dict) -> Dict[str, Any]:
         """Analisa composição da carteira para determinar exposições"""
         positions = latest_result.get('positions', [])
-        total_value = 0
-        
+
         exposures = {
             'juros_pre': 0,
             'cambio': 0,
@@ -419,23 +615,23 @@ class UnifiedXMLRiskAnalyzer:
             'credito': 0,
             'outros': 0
         }
-        
-        # Calcular valor total
-        for pos in positions:
-            value = pos.get('holding_value', 0)
-            total_value += value
-        
+
+        # Núcleo numérico vetorizado: valores, total, pesos, maior posição e
+        # contagem de diversificação saem das colunas SoA
+        values = positions_to_arrays(positions)['holding_value']
+        total_value = float(values.sum())
+
         if total_value == 0:
             return {'error': 'Valor total zero'}
-        
-        # Classificar exposições
-        for pos in positions:
-            value = pos.get('holding_value', 0)
-            weight = value / total_value
-            
+
+        # tolist() devolve floats nativos, mantendo o resultado serializável
+        weights = (values / total_value).tolist()
+
+        # Classificar exposições (matching de strings fica no loop Python)
+        for pos, weight in zip(positions, weights):
             risk_class = self.classify_asset_risk(pos)
             risk_type = risk_class['risk_type']
-            
+
             if risk_type == 'JUROS_PRE':
                 exposures['juros_pre'] += weight
             elif risk_type == 'DOLAR':
@@ -446,12 +642,12 @@ class UnifiedXMLRiskAnalyzer:
                 exposures['credito'] += weight
             else:
                 exposures['outros'] += weight
-        
+
         return {
             'total_value': total_value,
             'exposures': {k: v * 100 for k, v in exposures.items()},
-            'largest_position': max(positions, key=lambda x: x.get('holding_value', 0)) if positions else None,
-            'diversification_count': len([p for p in positions if p.get('holding_value', 0) > 0])
+            'largest_position': positions[int(values.argmax())] if positions else None,
+            'diversification_count': int((values > 0).sum())
         }
     
     def calculate_stress_scenarios(self, portfolio_analysis: Dict) -> Dict[str, str]:
@@ -493,9 +689,12 @@ class UnifiedXMLRiskAnalyzer:
         
         return scenarios
     
-    def calculate_from_portfolio_analysis(self, valid_results: List[Dict]) -> Dict[str, Any]:
+    def calculate_from_portfolio_analysis(self, valid_results: List[Dict],
+                                          latest_result: Optional[Dict] = None) -> Dict[str, Any]:
         """Fallback quando não há série temporal suficiente"""
-        portfolio_analysis = self.analyze_portfolio_composition(valid_results[-1])
+        if latest_result is None:
+            latest_result = max(valid_results, key=_statement_date_key)
+        portfolio_analysis = self.analyze_portfolio_composition(latest_result)
         exposures = portfolio_analysis.get('exposures', {})
         
         # Estimar volatilidade baseada na composição
@@ -505,7 +704,7 @@ class UnifiedXMLRiskAnalyzer:
         estimated_vol += exposures.get('imobiliario', 0) * 0.012 / 100  # FIIs
         
         # VaR estimado
-        var_21d = 1.645 * estimated_vol * math.sqrt(21)
+        var_21d = _Z_SCORE_95 * estimated_vol * _SQRT_21
         
         return {
             'var_21_days_95_percent': var_21d * 100,
@@ -520,37 +719,29 @@ class UnifiedXMLRiskAnalyzer:
     
     def get_default_metrics(self) -> Dict[str, Any]:
         """Métricas padrão quando falha tudo"""
-        return {
-            'var_21_days_95_percent': 7.5,
-            'var_model_class': "Modelo Paramétrico Padrão",
-            'daily_volatility': 1.5,
-            'mean_return': 0.05,
-            'worst_return': -2.5,
-            'observations': 0,
-            'stress_scenarios': {
-                'ibovespa_worst': 'Cenário IBOVESPA: Queda de 15%',
-                'juros_pre_worst': 'Cenário Juros: Alta de 200bps',
-                'cupom_cambial_worst': 'Cenário Cupom Cambial: Alta de 150bps',
-                'dolar_worst': 'Cenário Dólar: Valorização de 20%',
-                'outros_worst': 'Cenário Outros: Stress de Liquidez'
-            }
-        }
+        return dict(_DEFAULT_METRICS)
     
     def generate_risk_answers(self, all_results: List[Dict]) -> Dict[str, Any]:
         """Gera as respostas para as perguntas de risco"""
+        # Filtra uma única vez; calculate_var_and_metrics reaproveita a lista
         valid_results = [r for r in all_results if r.get('success', False)]
-        
+
         if not valid_results:
             return {"erro": "Nenhum arquivo válido processado"}
-        
+
+        # Resultado mais recente por statement_date, localizado uma única
+        # vez e repassado aos cálculos (a ordem da lista segue a ordem de
+        # processamento, não a cronológica)
+        latest_result = max(valid_results, key=_statement_date_key)
+
         # Calcular métricas
-        metrics = self.calculate_var_and_metrics(all_results)
+        metrics = self.calculate_var_and_metrics(valid_results, latest_result)
         portfolio_analysis = metrics.get('portfolio_analysis', {})
         stress_scenarios = metrics.get('stress_scenarios', {})
         exposures = portfolio_analysis.get('exposures', {})
-        
+
         # Informações do fundo (pegar do mais recente)
-        latest_fund = valid_results[-1]['fund_info']
+        latest_fund = latest_result['fund_info']
         
         # Calcular sensibilidades baseadas na exposição real
         sens_juros = -exposures.get('juros_pre', 50) * 0.8 / 100  # Renda fixa sensível a juros
@@ -576,11 +767,11 @@ class UnifiedXMLRiskAnalyzer:
             # Respostas às perguntas específicas
             "1_var_21_days_95_percent": f"{metrics['var_21_days_95_percent']:.2f}%",
             "2_var_model_class": metrics['var_model_class'],
-            "3_ibovespa_worst_scenario": stress_scenarios.get('ibovespa_worst', 'Cenário IBOVESPA: Queda de 15%'),
-            "4_juros_pre_worst_scenario": stress_scenarios.get('juros_pre_worst', 'Cenário Juros: Alta de 200bps'),
-            "5_cupom_cambial_worst_scenario": stress_scenarios.get('cupom_cambial_worst', 'Cenário Cupom Cambial: Alta de 150bps'),
-            "6_dolar_worst_scenario": stress_scenarios.get('dolar_worst', 'Cenário Dólar: Valorização de 20%'),
-            "7_outros_worst_scenario": stress_scenarios.get('outros_worst', 'Cenário Outros: Stress de Liquidez'),
+            "3_ibovespa_worst_scenario": stress_scenarios.get('ibovespa_worst', _DEFAULT_STRESS_SCENARIOS['ibovespa_worst']),
+            "4_juros_pre_worst_scenario": stress_scenarios.get('juros_pre_worst', _DEFAULT_STRESS_SCENARIOS['juros_pre_worst']),
+            "5_cupom_cambial_worst_scenario": stress_scenarios.get('cupom_cambial_worst', _DEFAULT_STRESS_SCENARIOS['cupom_cambial_worst']),
+            "6_dolar_worst_scenario": stress_scenarios.get('dolar_worst', _DEFAULT_STRESS_SCENARIOS['dolar_worst']),
+            "7_outros_worst_scenario": stress_scenarios.get('outros_worst', _DEFAULT_STRESS_SCENARIOS['outros_worst']),
             "8_daily_expected_variation": f"{metrics['mean_return']:.2f}%",
             "9_worst_stress_variation": f"{metrics['worst_return']:.2f}%",
             "10_sensitivity_juros_1pct": f"{sens_juros:.2f}%",
@@ -597,20 +788,32 @@ class UnifiedXMLRiskAnalyzer:
         return answers
 
 # Exemplo de uso
-def process_xml_files(directory_path: str) -> Dict[str, Any]:
-    """Processa todos os arquivos XML no diretório"""
-    analyzer = UnifiedXMLRiskAnalyzer()
+def process_xml_files(directory_path: str,
+                      analyzer: Optional[UnifiedXMLRiskAnalyzer] = None) -> Dict[str, Any]:
+    """Processa todos os arquivos XML no diretório.
+
+    Passar um analyzer compartilhado preserva o cache de parsing entre
+    chamadas; sem ele, cada chamada parte de um cache frio.
+    """
+    if analyzer is None:
+        analyzer = UnifiedXMLRiskAnalyzer()
     results = []
-    
+
     if not os.path.exists(directory_path):
         return {"erro": f"Diretório não encontrado: {directory_path}"}
-    
-    xml_files = [f for f in os.listdir(directory_path) if f.endswith('.xml')]
-    
-    for file_name in xml_files:
-        file_path = os.path.join(directory_path, file_name)
-        result = analyzer.parse_xml_file(file_path)
-        results.append(result)
+
+    # scandir entrega DirEntry com stat em cache: uma passada só pelo
+    # diretório, sem um syscall extra por arquivo
+    with os.scandir(directory_path) as entries:
+        xml_files = [entry.path for entry in entries
+                     if entry.is_file() and entry.name.endswith('.xml')]
+
+    # Parsing em paralelo: o etree.parse do lxml libera o GIL, então threads
+    # escalam bem nesse workload de I/O + parse em C
+    if xml_files:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(analyzer.parse_xml_file, xml_files))
     
     # Gerar respostas
     answers = analyzer.generate_risk_answers(results)
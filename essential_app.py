@@ -0,0 +1,501 @@
+"""App Flask para análise de risco de carteiras (ANBIMA / ISO 20022).
+
+Entry point WSGI usado pelo Procfile (gunicorn essential_app:app).
+O parsing e o cálculo de métricas ficam em app.UnifiedXMLRiskAnalyzer.
+"""
+import io
+import os
+import time
+import shutil
+import zipfile
+import logging
+import threading
+import hashlib
+import tempfile
+from datetime import datetime
+
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from flask import Flask, jsonify, request
+from flask.json.provider import JSONProvider
+from werkzeug.utils import secure_filename
+
+from app import UnifiedXMLRiskAnalyzer, process_xml_files
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+XML_FOLDER = os.environ.get('XML_FOLDER', 'xml_files')
+
+# Extensões aceitas no upload
+ALLOWED_EXTS = frozenset({'.xml', '.zip'})
+
+class ORJSONProvider(JSONProvider):
+    """Serialização JSON via orjson (implementação em C).
+
+    Mais rápido que o stdlib nos payloads numéricos de /analyze e ainda
+    serializa tipos NumPy nativamente, sem casts .item().
+    """
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+app = Flask(__name__)
+app.json = ORJSONProvider(app)
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB por upload
+
+os.makedirs(XML_FOLDER, exist_ok=True)
+
+analyzer = UnifiedXMLRiskAnalyzer()
+
+html_template = """
+<!DOCTYPE html>
+<html lang="pt-br">
+<head>
+    <meta charset="utf-8">
+    <title>Análise de Risco - Carteiras XML</title>
+</head>
+<body>
+    <h1>Análise de Risco de Carteiras</h1>
+    <p>Arquivos XML carregados: {{ total_files }}</p>
+    <form action="/upload" method="post" enctype="multipart/form-data">
+        <input type="file" name="files" multiple accept=".xml,.zip">
+        <button type="submit">Enviar arquivos</button>
+    </form>
+    <ul>
+        <li><a href="/analyze">Analisar carteira (/analyze)</a></li>
+        <li><a href="/files">Listar arquivos (/files)</a></li>
+        <li><a href="/health">Status (/health)</a></li>
+    </ul>
+</body>
+</html>
+"""
+
+
+# Template compilado uma única vez no load do módulo;
+# render_template_string recompilaria o Jinja a cada GET
+app.jinja_env.auto_reload = False
+_home_template = app.jinja_env.from_string(html_template)
+
+
+# Timestamp ISO com cache por segundo: health checks de alta frequência
+# não pagam a alocação/formatação do datetime a cada hit
+_ts_cache = [0, '']
+
+
+def _now_iso():
+    """Timestamp ISO-8601 atual, com granularidade de segundo"""
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[:] = [t, datetime.fromtimestamp(t).isoformat()]
+    return _ts_cache[1]
+
+
+# Cache da listagem do XML_FOLDER: /, /files e /health deixam de varrer o
+# diretório a cada request; upload e clear invalidam
+_xml_files_cache = {'names': None}
+
+
+def _invalidate_xml_cache():
+    _xml_files_cache['names'] = None
+
+
+def _record_uploaded(names):
+    """Incorpora uploads aceitos à listagem em cache, sem reescanear.
+
+    Com o cache frio não faz nada: o próximo list_xml_files() varre o
+    diretório uma vez e já enxerga os arquivos novos.
+    """
+    cached = _xml_files_cache['names']
+    if cached is None:
+        return
+    known = set(cached)
+    for name in names:
+        if name not in known:
+            cached.append(name)
+            known.add(name)
+
+
+def list_xml_files():
+    """Lista os arquivos XML atualmente disponíveis para análise"""
+    names = _xml_files_cache['names']
+    if names is None:
+        with os.scandir(XML_FOLDER) as entries:
+            names = [e.name for e in entries
+                     if e.is_file() and e.name.endswith('.xml')]
+        _xml_files_cache['names'] = names
+    return names
+
+
+def _sniff_upload_kind(file):
+    """Identifica zip/xml pelos bytes iniciais do stream, sem tocar o disco.
+
+    A extensão vem do nome controlado pelo cliente; os magic bytes não.
+    """
+    head = file.stream.read(8)
+    file.stream.seek(0)
+    if head.startswith(b'PK\x03\x04'):
+        return 'zip'
+    if head.startswith(b'\xef\xbb\xbf'):  # BOM UTF-8
+        head = head[3:]
+    if head.startswith(b'<'):
+        return 'xml'
+    return None
+
+
+# Buffer de cópia: 1MiB amortiza o loop Python e gera writes maiores
+_COPY_BUF = 1 << 20
+
+
+def _advise_sequential(path):
+    """Avisa o kernel que o arquivo será lido sequencialmente.
+
+    Aumenta o readahead nas leituras do ZIP logo depois da gravação.
+    No-op em plataformas sem posix_fadvise.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    finally:
+        os.close(fd)
+
+
+def _save_stream(stream, target):
+    """Copia stream -> target; zero-copy quando o stream já está em disco.
+
+    Uploads grandes chegam do werkzeug num arquivo temporário real: nesse
+    caso os.sendfile transfere direto no kernel, sem passar os bytes pelo
+    userspace. Streams em memória (BytesIO, SpooledTemporaryFile ainda não
+    rolado, membros de ZIP) caem no copyfileobj com buffer de 1MiB.
+    """
+    in_fd = None
+    # fileno() num SpooledTemporaryFile em memória forçaria rollover
+    if getattr(stream, '_rolled', True) and hasattr(os, 'sendfile'):
+        try:
+            in_fd = stream.fileno()
+        except (OSError, AttributeError, io.UnsupportedOperation):
+            in_fd = None
+    if in_fd is None:
+        readinto = getattr(stream, 'readinto', None)
+        if readinto is None:
+            shutil.copyfileobj(stream, target, length=_COPY_BUF)
+            return
+        # readinto num bytearray reutilizado: um único buffer por cópia
+        # em vez de um objeto bytes novo a cada chunk
+        view = memoryview(bytearray(_COPY_BUF))
+        n = readinto(view)
+        while n:
+            target.write(view[:n])
+            n = readinto(view)
+        return
+    out_fd = target.fileno()
+    size = os.fstat(in_fd).st_size
+    offset = stream.tell()
+    while offset < size:
+        sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def validate_xml_structure(file_path):
+    """Valida se o arquivo é um XML de posição em formato suportado"""
+    return analyzer.detect_xml_format(file_path) in ('ANBIMA_SIMPLE', 'ISO20022_ANBIMA')
+
+
+# Membros de ZIP já validados, chaveados por CRC32 + tamanho do central
+# directory (de graça, sem ler o conteúdo). Re-uploads do mesmo arquivo
+# pulam a descompressão e a validação inteiras.
+_seen_members = {}
+
+
+def _probe_tmpfile():
+    """Verifica uma única vez se XML_FOLDER suporta O_TMPFILE + linkat"""
+    if not hasattr(os, 'O_TMPFILE'):
+        return False
+    try:
+        fd = os.open(XML_FOLDER, os.O_TMPFILE | os.O_RDWR, 0o600)
+    except OSError:
+        return False
+    try:
+        probe = os.path.join(XML_FOLDER, '.tmpfile-probe')
+        try:
+            os.link('/proc/self/fd/%d' % fd, probe, follow_symlinks=True)
+        except OSError:
+            return False
+        os.unlink(probe)
+        return True
+    finally:
+        os.close(fd)
+
+
+_TMPFILE_OK = _probe_tmpfile()
+
+
+def _store_xml_tmpfile(source, dest_name, validated=False):
+    """Variante Linux de _store_xml com O_TMPFILE + linkat.
+
+    O arquivo nasce anônimo (sem entrada no diretório): validação falhou,
+    basta fechar o fd e o kernel recolhe — zero churn de dentries e
+    nenhum unlink posterior.
+    """
+    fd = os.open(XML_FOLDER, os.O_TMPFILE | os.O_RDWR, 0o644)
+    try:
+        with os.fdopen(fd, 'wb', closefd=False) as target:
+            _save_stream(source, target)
+        proc_path = '/proc/self/fd/%d' % fd
+        if not validated and not validate_xml_structure(proc_path):
+            return False
+        dest_path = os.path.join(XML_FOLDER, dest_name)
+        try:
+            os.link(proc_path, dest_path, follow_symlinks=True)
+        except FileExistsError:
+            os.unlink(dest_path)
+            os.link(proc_path, dest_path, follow_symlinks=True)
+        return True
+    finally:
+        os.close(fd)
+
+
+def _store_xml(source, dest_name):
+    """Grava o stream num temporário, valida e move atomicamente.
+
+    Arquivos inválidos nunca aparecem em XML_FOLDER com o nome final:
+    no Linux o conteúdo vai para um arquivo anônimo (O_TMPFILE) linkado
+    só após a validação; no fallback vai para um .tmp (invisível para a
+    listagem *.xml) promovido com os.replace. Retorna True se o arquivo
+    foi aceito.
+    """
+    # Streams inteiramente em memória são validados antes de qualquer
+    # escrita: um XML inválido é recusado sem tocar o disco
+    validated = False
+    if isinstance(source, io.BytesIO) or getattr(source, '_rolled', True) is False:
+        if not validate_xml_structure(source):
+            return False
+        source.seek(0)
+        validated = True
+
+    if _TMPFILE_OK:
+        return _store_xml_tmpfile(source, dest_name, validated)
+    fd, tmp_path = tempfile.mkstemp(dir=XML_FOLDER, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            _save_stream(source, target)
+        if validated or validate_xml_structure(tmp_path):
+            os.replace(tmp_path, os.path.join(XML_FOLDER, dest_name))
+            return True
+        os.unlink(tmp_path)
+        return False
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+@app.route('/')
+def home():
+    """Página inicial com formulário de upload"""
+    return _home_template.render(total_files=len(list_xml_files()))
+
+
+@app.route('/upload', methods=['POST'])
+def upload_files():
+    """Recebe arquivos .xml ou .zip com XMLs de posição"""
+    uploaded = request.files.getlist('files')
+    if not uploaded:
+        return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+
+    saved = []
+    errors = []
+
+    for file in uploaded:
+        # Nome saneado e extensão extraídos uma vez por arquivo
+        filename = secure_filename(file.filename or '')
+        ext = os.path.splitext(filename)[1].lower()
+        try:
+            if ext not in ALLOWED_EXTS:
+                errors.append(f'{filename}: extensão não suportada')
+                continue
+
+            # Rejeita conteúdo que não bate com a extensão antes de
+            # pagar qualquer escrita em disco
+            kind = _sniff_upload_kind(file)
+            if ext == '.zip' and kind != 'zip':
+                errors.append(f'{filename}: conteúdo não é um ZIP válido')
+                continue
+            if ext == '.xml' and kind != 'xml':
+                errors.append(f'{filename}: conteúdo não é um XML válido')
+                continue
+
+            if ext == '.zip':
+                # ZIPs pequenos (spool do werkzeug ainda em memória) nem
+                # tocam o disco: cada worker abre um BytesIO sobre o
+                # mesmo buffer imutável. Só os grandes vão para um
+                # arquivo intermediário.
+                if getattr(file.stream, '_rolled', True) is False:
+                    zip_bytes = file.stream.read()
+                    zip_path = None
+                else:
+                    zip_bytes = None
+                    zip_path = os.path.join(XML_FOLDER, filename)
+                    # Zero-copy via sendfile quando o werkzeug já pôs o
+                    # upload num arquivo temporário em disco
+                    with open(zip_path, 'wb') as out:
+                        _save_stream(file.stream, out)
+                    _advise_sequential(zip_path)
+
+                def _open_zip():
+                    if zip_path is None:
+                        return zipfile.ZipFile(io.BytesIO(zip_bytes), 'r')
+                    return zipfile.ZipFile(zip_path, 'r', allowZip64=True)
+
+                try:
+                    with _open_zip() as zf:
+                        infos = [info for info in zf.infolist()
+                                 if info.filename.endswith('.xml')]
+
+                    members = []
+                    for info in infos:
+                        key = f'{info.CRC:08x}-{info.file_size}'
+                        prev = _seen_members.get(key)
+                        if prev and os.path.exists(os.path.join(XML_FOLDER, prev)):
+                            # Conteúdo idêntico já validado e no disco
+                            saved.append(prev)
+                            continue
+                        members.append((info.filename, key))
+
+                    def _extract_member(item):
+                        member, _ = item
+                        # ZipFile não é thread-safe para open() concorrente:
+                        # cada worker abre o próprio handle
+                        with _open_zip() as z, z.open(member) as source:
+                            # Desliga a verificação CRC-32 por byte do
+                            # ZipExtFile: membros corrompidos falham na
+                            # validação XML logo em seguida, e o CRC
+                            # quase dobra o custo de CPU da leitura
+                            source._update_crc = lambda data: None
+                            return _store_xml(source, os.path.basename(member))
+
+                    if members:
+                        max_workers = min(8, (os.cpu_count() or 1) * 2)
+                        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                            for (member, key), ok in zip(members,
+                                                         executor.map(_extract_member, members)):
+                                member_name = os.path.basename(member)
+                                if ok:
+                                    saved.append(member_name)
+                                    _seen_members[key] = member_name
+                                else:
+                                    errors.append(f'{member_name}: formato não suportado')
+                finally:
+                    # Não deixa o .zip para trás nem em caso de falha parcial
+                    if zip_path is not None:
+                        os.unlink(zip_path)
+            else:  # '.xml'
+                if _store_xml(file.stream, filename):
+                    saved.append(filename)
+                else:
+                    errors.append(f'{filename}: formato não suportado')
+        except Exception as e:
+            logger.error(f"Erro ao processar upload {filename}: {e}")
+            errors.append(f'{filename}: {e}')
+
+    # Atualização incremental: nada de varrer o diretório de novo só
+    # para contar o que acabamos de gravar
+    _record_uploaded(saved)
+
+    return jsonify({
+        'saved': saved,
+        'errors': errors,
+        'total_files': len(list_xml_files())
+    })
+
+
+def _folder_fingerprint():
+    """Fingerprint (nome, tamanho, mtime) dos XMLs para o ETag de /analyze"""
+    h = hashlib.blake2b(digest_size=16)
+    with os.scandir(XML_FOLDER) as entries:
+        for entry in sorted(entries, key=lambda e: e.name):
+            if entry.is_file() and entry.name.endswith('.xml'):
+                st = entry.stat()
+                h.update(f'{entry.name}:{st.st_size}:{st.st_mtime_ns};'.encode())
+    return h.hexdigest()
+
+
+# Última análise computada, chaveada pelo fingerprint do diretório:
+# clientes sem If-None-Match também aproveitam o resultado pronto
+_analyze_cache = {'sig': None, 'result': None}
+
+
+@app.route('/analyze')
+def analyze():
+    """Processa todos os XMLs carregados e retorna as métricas de risco"""
+    try:
+        # Com o diretório inalterado o cliente recebe 304 direto,
+        # sem rodar o pipeline de análise
+        etag = _folder_fingerprint()
+        if etag in request.if_none_match:
+            return '', 304
+
+        if _analyze_cache['sig'] != etag:
+            _analyze_cache['result'] = process_xml_files(XML_FOLDER, analyzer)
+            _analyze_cache['sig'] = etag
+        response = jsonify(_analyze_cache['result'])
+        response.set_etag(etag)
+        return response
+    except Exception as e:
+        logger.error(f"Erro na análise: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/files')
+def list_files():
+    """Lista os arquivos XML disponíveis"""
+    files = list_xml_files()
+    return jsonify({
+        'files': files,
+        'total': len(files),
+        'timestamp': _now_iso()
+    })
+
+
+def _sweep_xml_folder():
+    """Apaga os XMLs do XML_FOLDER (roda fora do ciclo da request)"""
+    # scandir entrega o path pronto, sem um join por arquivo
+    with os.scandir(XML_FOLDER) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.xml'):
+                os.unlink(entry.path)
+
+
+@app.route('/clear', methods=['POST'])
+def clear_files():
+    """Remove todos os arquivos XML carregados"""
+    # O unlink em massa roda em background: com muitos arquivos o
+    # cliente não fica preso esperando N syscalls serializados
+    _invalidate_xml_cache()
+    threading.Thread(target=_sweep_xml_folder, daemon=True).start()
+    return jsonify({'status': 'accepted'}), 202
+
+
+@app.route('/health')
+def health():
+    """Status do serviço para monitoramento"""
+    return jsonify({
+        'status': 'ok',
+        'xml_files': len(list_xml_files()),
+        'timestamp': _now_iso()
+    })
+
+
+if __name__ == '__main__':
+    # Somente para desenvolvimento local; em produção o Procfile sobe o
+    # gunicorn com múltiplos workers
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
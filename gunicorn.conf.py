@@ -0,0 +1,16 @@
+"""Configuração do gunicorn para o essential_app.
+
+preload_app compartilha via copy-on-write o template compilado e os
+XPaths pré-compilados entre os workers; gthread deixa os parses do lxml
+(que liberam o GIL) sobreporem dentro de cada worker.
+"""
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = 4
+timeout = 120
+max_requests = 500
+max_requests_jitter = 50
+preload_app = True